@@ -0,0 +1,174 @@
+"""
+Shared access to the Excel data files the ingestion tasks read.
+
+Parsing a workbook is the slowest part of ingestion, and the loan sheet is
+read by both loan ingestion and the current debt refresh, so each process
+parses a file once and every later read is served from that copy.
+"""
+from functools import lru_cache
+import logging
+import os
+
+from django.conf import settings
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, pandas_dtype
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_DATA_PATH = settings.DATA_DIR / 'customer_data.xlsx'
+LOAN_DATA_PATH = settings.DATA_DIR / 'loan_data.xlsx'
+
+# Prefer the Rust-based calamine reader for Excel files; openpyxl remains the
+# fallback when python-calamine is not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
+
+
+# Workbooks at least this large are streamed in chunks rather than parsed
+# whole into memory when no Parquet cache exists yet
+STREAM_MIN_BYTES = 50 * 1024 * 1024
+
+
+def _parquet_cache(file_path):
+    """Return the Parquet cache path for a data file if it is up to date"""
+    cache_path = file_path.with_suffix('.parquet')
+    if cache_path.exists() and cache_path.stat().st_mtime >= file_path.stat().st_mtime:
+        return cache_path
+    return None
+
+
+@lru_cache(maxsize=2)
+def _read_data_file(file_path, mtime):
+    """
+    Parse a data file into a DataFrame, memoised per process. `mtime` is only
+    part of the cache key, so an edited file is parsed again.
+    
+    Excel files are cached as a Parquet sibling so later reads go through
+    pyarrow instead of re-parsing the workbook.
+    """
+    cache_path = _parquet_cache(file_path)
+    if cache_path is not None:
+        return pd.read_parquet(cache_path, engine='pyarrow')
+    cache_path = file_path.with_suffix('.parquet')
+    
+    df = pd.read_excel(file_path, engine=EXCEL_ENGINE)
+    
+    # Write to a temporary file first so concurrent readers never see a
+    # half-written cache
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp_path, engine='pyarrow', index=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.warning(f"Could not cache {file_path.name} as Parquet: {e}")
+    
+    return df
+
+
+def load_df(file_path, usecols=None, dtype=None):
+    """
+    Load a data file as a DataFrame the caller is free to modify.
+    
+    The cache always holds the whole sheet so every caller can share it;
+    `usecols` and `dtype` are applied to the returned frame. Columns missing
+    from the sheet are skipped rather than raising.
+    """
+    df = _read_data_file(file_path, file_path.stat().st_mtime)
+    
+    if usecols is not None:
+        df = df[[col for col in usecols if col in df.columns]]
+    else:
+        df = df.copy()
+    return _coerce(df, dtype)
+
+
+def chunk_offsets(file_path, id_column, chunk_size):
+    """
+    Return the starting row of each `chunk_size` range of a data file, for
+    splitting ingestion into parallel tasks. Reading `id_column` to count
+    the rows also warms the Parquet cache before the tasks read the file.
+    A missing file yields a single range, so one task can report it.
+    """
+    if not file_path.exists():
+        return [0]
+    row_count = len(load_df(file_path, usecols=[id_column]))
+    return list(range(0, max(row_count, 1), chunk_size))
+
+
+def _coerce(df, dtype):
+    """
+    Apply the dtypes for whichever of their columns the frame has. Blank or
+    unparseable cells in numeric columns become missing values first, so
+    nullable dtypes such as 'Int64' keep them as NA instead of raising.
+    """
+    if not dtype:
+        return df
+    dtype = {col: col_type for col, col_type in dtype.items() if col in df.columns}
+    numeric = [col for col, col_type in dtype.items() if is_numeric_dtype(pandas_dtype(col_type))]
+    if numeric:
+        df = df.assign(**{col: pd.to_numeric(df[col], errors='coerce') for col in numeric})
+    return df.astype(dtype)
+
+
+def _iter_sheet_rows(file_path):
+    """
+    Yield the first sheet of a workbook row by row, header row first. Empty
+    cells come through as None from either engine.
+    """
+    if EXCEL_ENGINE == 'calamine':
+        from python_calamine import CalamineWorkbook
+        sheet = CalamineWorkbook.from_path(str(file_path)).get_sheet_by_index(0)
+        for row in sheet.iter_rows():
+            yield [None if value == '' else value for value in row]
+        return
+    
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(file_path, chunk_size, usecols=None, dtype=None):
+    """
+    Yield a data file as DataFrames of at most `chunk_size` rows, with the
+    same `usecols`/`dtype` handling as load_df.
+    
+    A fresh Parquet cache is streamed batch by batch. Without one, small
+    workbooks go through load_df so the parse is shared with other readers,
+    and large ones are streamed from the workbook to bound memory.
+    """
+    cache_path = _parquet_cache(file_path)
+    if cache_path is not None:
+        with pq.ParquetFile(cache_path) as parquet_file:
+            columns = None
+            if usecols is not None:
+                columns = [col for col in usecols if col in parquet_file.schema_arrow.names]
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield _coerce(batch.to_pandas(), dtype)
+        return
+    
+    if file_path.stat().st_size < STREAM_MIN_BYTES:
+        df = load_df(file_path, usecols=usecols, dtype=dtype)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+        return
+    
+    rows = _iter_sheet_rows(file_path)
+    header = [str(col) for col in next(rows, ())]
+    keep = [i for i, col in enumerate(header) if usecols is None or col in usecols]
+    columns = [header[i] for i in keep]
+    
+    chunk = []
+    for row in rows:
+        chunk.append([row[i] if i < len(row) else None for i in keep])
+        if len(chunk) == chunk_size:
+            yield _coerce(pd.DataFrame(chunk, columns=columns), dtype)
+            chunk = []
+    if chunk:
+        yield _coerce(pd.DataFrame(chunk, columns=columns), dtype)
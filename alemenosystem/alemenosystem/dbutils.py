@@ -0,0 +1,17 @@
+"""
+Database helpers shared by the ingestion tasks.
+"""
+from django.core.management.color import no_style
+from django.db import connection
+
+
+def reset_pk_sequence(model):
+    """
+    Move the primary key sequence of `model` past the ids loaded from the
+    data files, so rows created through the API do not collide with them
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
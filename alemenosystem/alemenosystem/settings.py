@@ -108,6 +108,10 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        # Keep connections open between requests and Celery tasks instead of
+        # reconnecting every time
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -156,12 +160,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CELERY_BROKER_URL = f'redis://{config("REDIS_HOST", default="localhost")}:6379/0'
 CELERY_RESULT_BACKEND = f'redis://{config("REDIS_HOST", default="localhost")}:6379/0'
-CELERY_ACCEPT_CONTENT = ['json']
-CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
+# msgpack is more compact and faster to encode than JSON; JSON is still
+# accepted so messages queued by older workers can be consumed
+CELERY_ACCEPT_CONTENT = ['msgpack', 'json']
+CELERY_TASK_SERIALIZER = 'msgpack'
+CELERY_RESULT_SERIALIZER = 'msgpack'
 CELERY_TIMEZONE = 'UTC'
 
 # Task execution settings
 CELERY_TASK_ALWAYS_EAGER = False  # Set to True for testing without Redis
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
+# Rows per INSERT statement for bulk_create during data ingestion
+BULK_CREATE_BATCH_SIZE = config('BULK_CREATE_BATCH_SIZE', default=10000, cast=int)
+# Rows per Celery task when ingestion is fanned out across workers
+INGEST_CHUNK_SIZE = config('INGEST_CHUNK_SIZE', default=10000, cast=int)
@@ -0,0 +1,58 @@
+from pathlib import Path
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase
+import pandas as pd
+
+from .datafiles import iter_chunks
+
+
+class IterChunksTest(TestCase):
+    """Every read path of iter_chunks yields the same frames"""
+
+    USECOLS = ['Customer ID', 'Name', 'Loan Amount']
+    DTYPES = {'Customer ID': 'Int64', 'Loan Amount': 'float64'}
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = Path(tmp_dir.name) / 'loan_data.xlsx'
+
+        # A blank id cell and a column that is not read
+        pd.DataFrame({
+            'Customer ID': [1, None, 3, 4, 5],
+            'Name': ['Asha', 'Ben', 'Chen', 'Dev', 'Eli'],
+            'Loan Amount': [1000.5, 2000.0, 3000.25, 4000.0, 5000.75],
+            'Notes': ['a', 'b', 'c', 'd', 'e'],
+        }).to_excel(self.path, index=False)
+
+        self.expected = pd.DataFrame({
+            'Customer ID': pd.array([1, None, 3, 4, 5], dtype='Int64'),
+            'Name': ['Asha', 'Ben', 'Chen', 'Dev', 'Eli'],
+            'Loan Amount': [1000.5, 2000.0, 3000.25, 4000.0, 5000.75],
+        })
+
+    def _read(self):
+        chunks = list(iter_chunks(self.path, 2, usecols=self.USECOLS, dtype=self.DTYPES))
+        return [len(chunk) for chunk in chunks], pd.concat(chunks, ignore_index=True)
+
+    def test_every_read_path_yields_the_same_frames(self):
+        """Test streaming the workbook, slicing load_df and reading the Parquet cache agree"""
+        cache_path = self.path.with_suffix('.parquet')
+
+        # Streamed row by row from the workbook, without writing a cache
+        with patch('alemenosystem.datafiles.STREAM_MIN_BYTES', 0):
+            streamed = self._read()
+        self.assertFalse(cache_path.exists())
+
+        # Parsed whole through load_df, which writes the Parquet cache
+        parsed = self._read()
+        self.assertTrue(cache_path.exists())
+
+        # Read back batch by batch from the Parquet cache
+        cached = self._read()
+
+        for sizes, frame in (streamed, parsed, cached):
+            self.assertEqual(sizes, [2, 2, 1])
+            pd.testing.assert_frame_equal(frame, self.expected)
@@ -1,8 +1,16 @@
+from contextlib import contextmanager
+from celery import group
 from django.core.management.base import BaseCommand
+from django.db import connection
 from customer.models import Customer
 from loan.models import Loan
-from customer.tasks import ingest_customer_data, update_customer_current_debt
-from loan.tasks import ingest_loan_data
+from customer.tasks import (
+    customer_chunk_group,
+    import_customer_data,
+    refresh_customer_current_debt,
+    update_customer_current_debt,
+)
+from loan.tasks import import_loan_data, loan_chunk_group
 
 class Command(BaseCommand):
     help = 'Ingest initial data from Excel files on first startup'
@@ -27,25 +35,27 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Checking if initial data ingestion is needed...'))
         
-        customer_count = Customer.objects.count()
-        loan_count = Loan.objects.count()
+        # Only presence drives the branching below, so probe with EXISTS
+        # rather than counting every row
+        customers_exist = Customer.objects.exists()
+        loans_exist = Loan.objects.exists()
         
-        self.stdout.write(f'Current counts - Customers: {customer_count}, Loans: {loan_count}')
+        self.stdout.write(f'Existing data - Customers: {customers_exist}, Loans: {loans_exist}')
         
         # Handle different scenarios
         if options['force']:
             self.stdout.write(self.style.WARNING('Force flag used - proceeding with full ingestion'))
-            self.run_full_ingestion(use_celery=options['use_celery'])
+            self.run_full_ingestion(use_celery=options['use_celery'], force=True)
         elif options['loans_only']:
             self.stdout.write(self.style.SUCCESS('Running loans-only ingestion...'))
             self.run_loans_only_ingestion(use_celery=options['use_celery'])
-        elif customer_count > 0 and loan_count == 0:
+        elif customers_exist and not loans_exist:
             self.stdout.write(self.style.WARNING('Customers exist but no loans found. Running loans ingestion...'))
             self.run_loans_only_ingestion(use_celery=options['use_celery'])
-        elif customer_count > 0 and loan_count > 0:
+        elif customers_exist and loans_exist:
             self.stdout.write(
                 self.style.WARNING(
-                    f'Data already exists (Customers: {customer_count}, Loans: {loan_count}). '
+                    'Data already exists. '
                     'Use --force to override or --loans-only to just ingest loans.'
                 )
             )
@@ -64,7 +74,7 @@ class Command(BaseCommand):
             )
         )
 
-    def run_full_ingestion(self, use_celery=False):
+    def run_full_ingestion(self, use_celery=False, force=False):
         """Run the complete ingestion step by step"""
         try:
             if use_celery:
@@ -72,7 +82,8 @@ class Command(BaseCommand):
                 self._run_with_celery_full()
             else:
                 self.stdout.write(self.style.SUCCESS('Starting full data ingestion synchronously...'))
-                self._run_synchronously_full()
+                with self._asynchronous_commit():
+                    self._run_synchronously_full(force=force)
                 
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error during full ingestion: {str(e)}'))
@@ -85,18 +96,38 @@ class Command(BaseCommand):
                 self._run_with_celery_loans_only()
             else:
                 self.stdout.write(self.style.SUCCESS('Starting loan ingestion synchronously...'))
-                self._run_synchronously_loans_only()
+                with self._asynchronous_commit():
+                    self._run_synchronously_loans_only()
                 
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error during loans-only ingestion: {str(e)}'))
 
-    def _run_synchronously_full(self):
-        """Run tasks synchronously without Celery"""
+    @contextmanager
+    def _asynchronous_commit(self):
+        """
+        Turn off synchronous_commit on this connection for the duration of a
+        one-shot bulk load, so commits do not wait for the WAL flush. A crash
+        can only lose the last few commits, and the load can simply be re-run.
+        """
+        if connection.vendor != 'postgresql':
+            yield
+            return
+        
+        with connection.cursor() as cursor:
+            cursor.execute("SET synchronous_commit = OFF")
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET synchronous_commit")
+
+    def _run_synchronously_full(self, force=False):
+        """Run the ingestion steps in-process, without going through Celery"""
         # Step 1: Customers
         self.stdout.write('Step 1: Ingesting customers...')
-        customer_result = ingest_customer_data()
+        customer_result = import_customer_data(force=force)
         
-        if customer_result['status'] != 'success':
+        if customer_result['status'] not in ('success', 'skipped'):
             self.stdout.write(self.style.ERROR(f"Customer ingestion failed: {customer_result['message']}"))
             return
         
@@ -104,7 +135,7 @@ class Command(BaseCommand):
         
         # Step 2: Loans
         self.stdout.write('Step 2: Ingesting loans...')
-        loan_result = ingest_loan_data()
+        loan_result = import_loan_data()
         
         if loan_result['status'] != 'success':
             self.stdout.write(self.style.ERROR(f"Loan ingestion failed: {loan_result['message']}"))
@@ -114,7 +145,7 @@ class Command(BaseCommand):
         
         # Step 3: Update debt
         self.stdout.write('Step 3: Updating customer current debt...')
-        debt_result = update_customer_current_debt()
+        debt_result = refresh_customer_current_debt()
         
         if debt_result['status'] == 'success':
             self.stdout.write(self.style.SUCCESS(f"Debt Update: {debt_result['message']}"))
@@ -124,14 +155,14 @@ class Command(BaseCommand):
     def _run_synchronously_loans_only(self):
         """Run loans and debt update synchronously"""
         # Step 1: Ingest loans
-        loan_result = ingest_loan_data()
+        loan_result = import_loan_data()
         
         if loan_result['status'] == 'success':
             self.stdout.write(self.style.SUCCESS(f"Loans: {loan_result['message']}"))
             
             # Step 2: Update current debt
             self.stdout.write('Updating customer current debt...')
-            debt_result = update_customer_current_debt()
+            debt_result = refresh_customer_current_debt()
             
             if debt_result['status'] == 'success':
                 self.stdout.write(self.style.SUCCESS(f"Debt Update: {debt_result['message']}"))
@@ -141,56 +172,61 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"Loan ingestion failed: {loan_result['message']}"))
 
     def _run_with_celery_full(self):
-        """Run the complete ingestion using Celery (original method)"""
-        # Step 1: Customers
-        self.stdout.write('Step 1: Ingesting customers...')
-        customer_task = ingest_customer_data.delay()
-        customer_result = customer_task.get(timeout=300)
-        
-        if customer_result['status'] != 'success':
-            self.stdout.write(self.style.ERROR(f"Customer ingestion failed: {customer_result['message']}"))
+        """Run the complete ingestion using Celery"""
+        # Customer row ranges are ingested by parallel workers. The loan row
+        # ranges and the debt update fan out the same way, but only once
+        # every customer chunk has succeeded
+        self.stdout.write('Step 1: Ingesting customers in parallel chunks...')
+        result = customer_chunk_group().apply_async()
+        customer_results = [self._outcome(r) for r in result.get(timeout=900, propagate=False)]
+        
+        failed = [r for r in customer_results if r['status'] != 'success']
+        if failed:
+            self.stdout.write(self.style.ERROR(f"Customer ingestion failed: {failed[0]['message']}"))
             return
         
-        self.stdout.write(self.style.SUCCESS(f"Customers: {customer_result['message']}"))
+        customer_count = sum(r['count'] for r in customer_results)
+        self.stdout.write(self.style.SUCCESS(f"Customers: Successfully ingested {customer_count} customers"))
         
-        # Step 2: Loans
-        self.stdout.write('Step 2: Ingesting loans...')
-        loan_task = ingest_loan_data.delay()
-        loan_result = loan_task.get(timeout=300)
-        
-        if loan_result['status'] != 'success':
-            self.stdout.write(self.style.ERROR(f"Loan ingestion failed: {loan_result['message']}"))
-            return
-        
-        self.stdout.write(self.style.SUCCESS(f"Loans: {loan_result['message']}"))
-        
-        # Step 3: Update debt
-        self.stdout.write('Step 3: Updating customer current debt...')
-        debt_task = update_customer_current_debt.delay()
-        debt_result = debt_task.get(timeout=300)
-        
-        if debt_result['status'] == 'success':
-            self.stdout.write(self.style.SUCCESS(f"Debt Update: {debt_result['message']}"))
-        else:
-            self.stdout.write(self.style.ERROR(f"Debt update failed: {debt_result['message']}"))
+        self.stdout.write('Step 2/3: Ingesting loans in parallel chunks and updating customer current debt...')
+        self._run_with_celery_loans_only()
 
     def _run_with_celery_loans_only(self):
         """Run only loan ingestion and debt update using Celery"""
-        # Step 1: Ingest loans
-        loan_task = ingest_loan_data.delay()
-        loan_result = loan_task.get(timeout=300)
-        
+        result = self._loans_and_debt_group().apply_async()
+        *loan_results, debt_result = map(self._outcome, result.get(timeout=900, propagate=False))
+        self._report_loans_and_debt(self._merge_loan_results(loan_results), debt_result)
+
+    @staticmethod
+    def _loans_and_debt_group():
+        """One group of every loan chunk task plus the debt update, which reads the sheet itself"""
+        return group(*loan_chunk_group().tasks, update_customer_current_debt.si())
+
+    @staticmethod
+    def _merge_loan_results(results):
+        """Combine the per-chunk loan results into one step outcome"""
+        failed = [r for r in results if r['status'] != 'success']
+        if failed:
+            return failed[0]
+        count = sum(r['count'] for r in results)
+        skipped = sum(r['skipped'] for r in results)
+        return {"status": "success", "message": f"Successfully ingested {count} loans, skipped {skipped}"}
+
+    @staticmethod
+    def _outcome(value):
+        """Normalise a task result; a task that raised yields its exception"""
+        if isinstance(value, dict):
+            return value
+        return {"status": "error", "message": str(value)}
+
+    def _report_loans_and_debt(self, loan_result, debt_result):
+        """Write the outcome of the loan ingestion and debt update steps"""
         if loan_result['status'] == 'success':
             self.stdout.write(self.style.SUCCESS(f"Loans: {loan_result['message']}"))
-            
-            # Step 2: Update current debt
-            self.stdout.write('Updating customer current debt...')
-            debt_task = update_customer_current_debt.delay()
-            debt_result = debt_task.get(timeout=300)
-            
-            if debt_result['status'] == 'success':
-                self.stdout.write(self.style.SUCCESS(f"Debt Update: {debt_result['message']}"))
-            else:
-                self.stdout.write(self.style.ERROR(f"Debt update failed: {debt_result['message']}"))
         else:
-            self.stdout.write(self.style.ERROR(f"Loan ingestion failed: {loan_result['message']}"))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f"Loan ingestion failed: {loan_result['message']}"))
+        
+        if debt_result['status'] == 'success':
+            self.stdout.write(self.style.SUCCESS(f"Debt Update: {debt_result['message']}"))
+        else:
+            self.stdout.write(self.style.ERROR(f"Debt update failed: {debt_result['message']}"))
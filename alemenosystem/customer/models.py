@@ -2,11 +2,11 @@ from django.db import models
 from django.core.validators import MinLengthValidator
 
 class Customer(models.Model):
-    customer_id = models.IntegerField(unique=True, db_index=True)
+    customer_id = models.AutoField(primary_key=True)
     first_name = models.CharField(max_length=15)
     last_name = models.CharField(max_length=15)
     age = models.IntegerField()
-    phone_number = models.CharField(max_length=15, unique=True, db_index=True,validators=[MinLengthValidator(10)])
+    phone_number = models.CharField(max_length=15, unique=True, validators=[MinLengthValidator(10)])
     monthly_salary = models.IntegerField(help_text="Monthly salary in local currency")
     approved_limit = models.IntegerField(help_text="Approved loan limit")
     current_debt = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -20,10 +20,8 @@ class Customer(models.Model):
 
     class Meta:
         db_table = 'customer'
-        #using indexes to speed up queries on customer_id and phone_number
-        indexes = [
-            models.Index(fields=["customer_id"]),
-            models.Index(fields=["phone_number"])
-        ]
+        # customer_id (primary key) and phone_number (unique) are already
+        # indexed by their constraints; extra indexes would only slow down
+        # every insert
 
 
@@ -2,6 +2,14 @@
 from rest_framework import serializers
 from .models import Customer
 import re
+import string
+
+
+# Compiled once at import instead of going through re's pattern cache per call
+_NON_DIGIT = re.compile(r'\D')
+
+# Deletes every allowed name character, so any leftover means an invalid name
+_STRIP_NAME_CHARS = str.maketrans('', '', string.ascii_letters + string.whitespace)
 
 
 class CustomerRegistrationSerializer(serializers.ModelSerializer):
@@ -59,7 +67,7 @@ class CustomerRegistrationSerializer(serializers.ModelSerializer):
 
     def validate_phone_number(self, value):
         # Remove any spaces or special characters
-        phone_clean = re.sub(r'[^\d]', '', value)
+        phone_clean = _NON_DIGIT.sub('', value)
         
         if len(phone_clean) < 10 or len(phone_clean) > 15:
             raise serializers.ValidationError("Phone number must be between 10 and 15 digits.")
@@ -71,13 +79,13 @@ class CustomerRegistrationSerializer(serializers.ModelSerializer):
 
     def validate_first_name(self, value):
         # Validate first name contains only alphabetic characters and spaces
-        if not re.match(r'^[a-zA-Z\s]+', value):
+        if value.translate(_STRIP_NAME_CHARS):
             raise serializers.ValidationError("First name must contain only alphabetic characters and spaces.")
         return value.strip().title()
 
     def validate_last_name(self, value):
         # Validate last name contains only alphabetic characters and spaces
-        if not re.match(r'^[a-zA-Z\s]+', value):
+        if value.translate(_STRIP_NAME_CHARS):
             raise serializers.ValidationError("Last name must contain only alphabetic characters and spaces.")
         return value.strip().title()
 
@@ -4,6 +4,10 @@ from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from .models import Customer
+from .serializers import CustomerRegistrationSerializer
+from .tasks import LOAN_DEBT_DTYPES, _current_debt_by_customer
+from alemenosystem.datafiles import _coerce
+import pandas as pd
 import json
 
 
@@ -76,13 +80,41 @@ class CustomerRegistrationTest(APITestCase):
         self.assertIn('error', response.json())
 
 
+class CustomerRegistrationSerializerTest(TestCase):
+    """Validation rules of the registration serializer"""
+    
+    def setUp(self):
+        self.valid_data = {
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'age': 30,
+            'monthly_income': 50000,
+            'phone_number': '98765 43210'
+        }
+    
+    def test_phone_number_is_normalised(self):
+        """Test non-digit characters are stripped from the phone number"""
+        serializer = CustomerRegistrationSerializer(data=self.valid_data)
+        
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['phone_number'], '9876543210')
+    
+    def test_name_with_trailing_digits_rejected(self):
+        """Test names are matched in full, not just by their leading letters"""
+        data = self.valid_data.copy()
+        data['first_name'] = 'Bob123'
+        serializer = CustomerRegistrationSerializer(data=data)
+        
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('first_name', serializer.errors)
+
+
 class CustomerListTest(APITestCase):
     """Simple test cases for Customer List API"""
     
-    def setUp(self):
-        self.list_url = reverse('customer-list-list')
-        # Create test customer
-        self.customer = Customer.objects.create(
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
             customer_id=1,
             first_name='Jane',
             last_name='Smith',
@@ -92,6 +124,9 @@ class CustomerListTest(APITestCase):
             approved_limit=2200000
         )
     
+    def setUp(self):
+        self.list_url = reverse('customer-list-list')
+    
     def test_list_customers(self):
         """Test listing all customers"""
         response = self.client.get(self.list_url)
@@ -101,6 +136,8 @@ class CustomerListTest(APITestCase):
         
         self.assertTrue(data['success'])
         self.assertEqual(data['count'], 1)
+        self.assertIsNone(data['next'])
+        self.assertEqual(len(data['data']), 1)
     
     def test_get_specific_customer(self):
         """Test retrieving specific customer"""
@@ -154,4 +191,42 @@ class CustomerModelTest(TestCase):
                 phone_number='0987654321',
                 monthly_salary=60000,
                 approved_limit=2000000
-            )
\ No newline at end of file
+            )
+
+
+class CurrentDebtCalculationTest(TestCase):
+    """Tests for the vectorized current debt aggregation"""
+    
+    def test_only_active_loans_are_summed_per_customer(self):
+        """Test ended loans are ignored and overpaid loans count as 0"""
+        loan_df = pd.DataFrame({
+            'Customer ID': [1, 1, 2, 3],
+            'Loan Amount': [100000, 50000, 20000, 30000],
+            'Monthly payment': [10000, 5000, 5000, 1000],
+            'EMIs paid on Time': [2, 1, 10, 5],
+            'End Date': pd.to_datetime(['2030-01-01', '2030-01-01', '2030-01-01', '2020-01-01']),
+        })
+        
+        debt_map, active_loans = _current_debt_by_customer(
+            loan_df, 'Customer ID', pd.Timestamp('2025-01-01')
+        )
+        
+        self.assertEqual(active_loans, 3)
+        self.assertEqual(debt_map, {1: 125000.0, 2: 0.0})
+    
+    def test_rows_with_blank_cells_are_skipped(self):
+        """Test a blank id or EMI count drops only its own row"""
+        loan_df = _coerce(pd.DataFrame({
+            'Customer ID': [1, None, 2, 2],
+            'Loan Amount': [100000, 50000, 20000, 30000],
+            'Monthly payment': [10000, 5000, 5000, 1000],
+            'EMIs paid on Time': [2, 1, '', 5],
+            'End Date': pd.to_datetime(['2030-01-01'] * 4),
+        }), LOAN_DEBT_DTYPES)
+        
+        debt_map, active_loans = _current_debt_by_customer(
+            loan_df, 'Customer ID', pd.Timestamp('2025-01-01')
+        )
+        
+        self.assertEqual(active_loans, 4)
+        self.assertEqual(debt_map, {1: 80000.0, 2: 25000.0})
@@ -1,5 +1,6 @@
 # views.py
 from rest_framework import viewsets, status
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError as DjangoValidationError
@@ -9,7 +10,6 @@ from rest_framework.viewsets import GenericViewSet
 from .models import Customer
 from .serializers import CustomerRegistrationSerializer, CustomerResponseSerializer
 
-
 class CustomerRegistrationViewSet(CreateModelMixin, GenericViewSet):
     """
     ViewSet for Customer registration
@@ -17,15 +17,6 @@ class CustomerRegistrationViewSet(CreateModelMixin, GenericViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerRegistrationSerializer
 
-    def generate_customer_id(self):
-        """
-        Generate unique customer_id
-        """
-        last_customer = Customer.objects.order_by('-customer_id').first()
-        if last_customer:
-            return last_customer.customer_id + 1
-        return 1
-
     def calculate_approved_limit(self, monthly_salary):
         """
         approved_limit = 36 * monthly_salary (rounded to nearest lakh)
@@ -51,27 +42,15 @@ class CustomerRegistrationViewSet(CreateModelMixin, GenericViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Check if customer with same phone number already exists
-            phone_number = serializer.validated_data.get('phone_number')
-            if Customer.objects.filter(phone_number=phone_number).exists():
-                return Response(
-                    {
-                        'error': 'Customer already exists',
-                        'message': 'A customer with this phone number already exists.'
-                    },
-                    status=status.HTTP_409_CONFLICT
-                )
-            
+            # A repeated phone number is caught by its unique constraint on
+            # insert (see the IntegrityError handler) rather than a pre-check
             #following ATOMIC principle to ensure data integrity
             with transaction.atomic():
-                # Generate unique customer_id
-                customer_id = self.generate_customer_id()
-                
                 monthly_income = serializer.validated_data.get('monthly_income')
                 approved_limit = self.calculate_approved_limit(monthly_income)
                 
+                # customer_id is issued by the database sequence on insert
                 customer = Customer.objects.create(
-                    customer_id=customer_id,
                     first_name=serializer.validated_data.get('first_name'),
                     last_name=serializer.validated_data.get('last_name'),
                     age=serializer.validated_data.get('age'),
@@ -92,7 +71,15 @@ class CustomerRegistrationViewSet(CreateModelMixin, GenericViewSet):
                 status=status.HTTP_201_CREATED
             )
 
-        except IntegrityError:
+        except IntegrityError as e:
+            if 'phone_number' in str(e):
+                return Response(
+                    {
+                        'error': 'Customer already exists',
+                        'message': 'A customer with this phone number already exists.'
+                    },
+                    status=status.HTTP_409_CONFLICT
+                )
             return Response(
                 {
                     'error': 'Database error',
@@ -129,20 +116,36 @@ class CustomerListViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
 
     def list(self, request, *args, **kwargs):
         """
-        List all customers
-        GET /customers/
+        List customers one page at a time
+        GET /customers/?page=N
         """
         try:
-            customers = Customer.objects.all()
-            serializer = CustomerResponseSerializer(customers, many=True)
+            # Only fetch the columns the response serializer renders, and a
+            # stable order so pages do not overlap
+            customers = Customer.objects.only(
+                'customer_id', 'first_name', 'last_name', 'age',
+                'monthly_salary', 'approved_limit', 'phone_number',
+            ).order_by('customer_id')
+            page = self.paginate_queryset(customers)
+            serializer = CustomerResponseSerializer(page, many=True)
             return Response(
                 {
                     'success': True,
-                    'count': customers.count(),
+                    'count': self.paginator.page.paginator.count,
+                    'next': self.paginator.get_next_link(),
+                    'previous': self.paginator.get_previous_link(),
                     'data': serializer.data
                 },
                 status=status.HTTP_200_OK
             )
+        except NotFound:
+            return Response(
+                {
+                    'error': 'Page not found',
+                    'message': 'The requested page does not exist.'
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
         except Exception:
             return Response(
                 {
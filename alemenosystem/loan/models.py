@@ -2,8 +2,8 @@ from django.db import models
 from customer.models import Customer
 
 class Loan(models.Model):
-    loan_id = models.IntegerField(unique=True, db_index=True)
-    customer = models.ForeignKey(Customer, to_field='customer_id', on_delete=models.CASCADE, related_name='loans')
+    loan_id = models.AutoField(primary_key=True)
+    customer = models.ForeignKey(Customer, to_field='customer_id', on_delete=models.CASCADE, related_name='loans', db_index=False)
     loan_amount = models.DecimalField(max_digits=12, decimal_places=2)
     tenure = models.IntegerField(help_text="Tenure in months")
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
@@ -13,12 +13,15 @@ class Loan(models.Model):
     end_date = models.DateField()
 
     def __str__(self):
-        return f"Loan {self.loan_id} - Customer {self.customer.customer_id}"
+        return f"Loan {self.loan_id} - Customer {self.customer_id}"
 
     class Meta:
         db_table = 'loan'
-        # using indexes to speed up queries on loan_id and customer
+        # Loans are almost always looked up per customer and narrowed by
+        # end date (active loans) or start date (loans this year). Both
+        # indexes lead with customer, so they also serve plain FK lookups;
+        # loan_id is the primary key and needs no index of its own
         indexes = [
-            models.Index(fields=["loan_id"]),
-            models.Index(fields=["customer"]),
+            models.Index(fields=["customer", "end_date"], name="loan_cust_end_idx"),
+            models.Index(fields=["customer", "start_date"], name="loan_cust_start_idx"),
         ]
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""Credit scoring and loan pricing shared by the loan API views"""
+from bisect import bisect_left
+from datetime import date
+from functools import lru_cache
+import math
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Loan
+from customer.models import Customer
+
+# Seconds a customer looked up by the loan endpoints stays cached
+CUSTOMER_CACHE_TIMEOUT = 60
+
+
+def get_customer_cached(customer_id):
+    """
+    Fetch the customer fields the loan endpoints need, served from the cache
+    for CUSTOMER_CACHE_TIMEOUT seconds after the first lookup. Raises
+    Customer.DoesNotExist for unknown ids, which are not cached.
+    """
+    cache_key = f"cust:{customer_id}"
+    customer = cache.get(cache_key)
+    if customer is None:
+        customer = Customer.objects.only(
+            'customer_id', 'monthly_salary', 'approved_limit'
+        ).get(customer_id=customer_id)
+        cache.set(cache_key, customer, timeout=CUSTOMER_CACHE_TIMEOUT)
+    return customer
+
+
+def gather_loan_stats(customer, today=None):
+    """
+    Collect everything the credit score and the EMI check need about a
+    customer's loans in one aggregate query. `today` defaults to the
+    current local date.
+    """
+    if today is None:
+        today = timezone.localdate()
+
+    # Loans started this year, as a plain date range on start_date
+    this_year = Q(start_date__gte=date(today.year, 1, 1), start_date__lt=date(today.year + 1, 1, 1))
+    active = Q(end_date__gte=today)
+    return Loan.objects.filter(customer=customer).aggregate(
+        total_loans=Count('loan_id'),
+        total_emis_expected=Sum('tenure'),
+        total_emis_paid_on_time=Sum('emis_paid_on_time'),
+        total_approved_amount=Sum('loan_amount'),
+        current_loans_sum=Sum('loan_amount', filter=active),
+        current_emi=Sum('monthly_installment', filter=active),
+        current_year_loans=Count('loan_id', filter=this_year),
+    )
+
+
+def score_from_stats(stats, customer):
+    """
+    Calculate credit score from the aggregates of gather_loan_stats()
+    """
+    total_loans = stats['total_loans']
+
+    if total_loans == 0:
+        return 0  # No loan history
+
+    # Check if sum of current loans > approved limit
+    current_loans_sum = stats['current_loans_sum'] or 0
+
+    if current_loans_sum > customer.approved_limit:
+        return 0
+
+    credit_score = 0
+
+    # 1. Past Loans paid on time (30 points max)
+    total_emis_expected = stats['total_emis_expected'] or 0
+    total_emis_paid_on_time = stats['total_emis_paid_on_time'] or 0
+
+    if total_emis_expected > 0:
+        payment_ratio = total_emis_paid_on_time / total_emis_expected
+        credit_score += min(30, payment_ratio * 30)
+
+    # 2. Number of loans taken in past (20 points max, diminishing returns after 5 loans)
+    if total_loans <= 5:
+        credit_score += min(20, total_loans * 4)
+    else:
+        credit_score += 20 - ((total_loans - 5) * 2)  # Penalty for too many loans
+
+    # 3. Loan activity in current year (25 points max)
+    current_year_loans = stats['current_year_loans']
+    if current_year_loans > 0:
+        credit_score += min(25, current_year_loans * 8)
+
+    # 4. Loan approved volume vs salary ratio (25 points max)
+    total_approved_amount = stats['total_approved_amount'] or 0
+    if customer.monthly_salary > 0:
+        approval_ratio = total_approved_amount / (customer.monthly_salary * 12)  # Annual salary
+        if approval_ratio <= 5:  # Good ratio
+            credit_score += 25
+        elif approval_ratio <= 10:  # Moderate ratio
+            credit_score += 15
+        elif approval_ratio <= 15:  # High ratio
+            credit_score += 5
+        # No points for very high ratio
+
+    return min(100, max(0, credit_score))
+
+
+def calculate_credit_score(customer, today=None):
+    """
+    Calculate credit score based on historical loan data
+    """
+    return score_from_stats(gather_loan_stats(customer, today), customer)
+
+
+@lru_cache(maxsize=1024)
+def _compound_factor(monthly_rate, tenure):
+    """(1 + r)^n, memoised since quotes repeat the same few rate/tenure pairs"""
+    return math.pow(1.0 + monthly_rate, tenure)
+
+
+def calculate_monthly_installment(loan_amount, interest_rate, tenure):
+    """Calculate monthly installment using EMI formula"""
+    P = float(loan_amount)
+    r = float(interest_rate) / (12 * 100)  # Monthly interest rate
+    n = int(tenure)
+
+    if r == 0:
+        return P / n
+
+    factor = _compound_factor(r, n)
+    emi = P * r * factor / (factor - 1.0)
+    return round(emi, 2)
+
+
+# Credit score thresholds, and the (approved, minimum interest rate) that
+# applies above each. A score has to exceed a threshold to reach its tier
+_SCORE_THRESHOLDS = (10, 30, 50)
+_RATE_TIERS = (
+    (False, None),  # 10 and below: rejected
+    (True, 16.0),
+    (True, 12.0),
+    (True, None),   # Above 50: no minimum rate
+)
+
+
+def determine_approval(credit_score, requested_rate):
+    """Determine approval and corrected interest rate based on credit score"""
+    approved, min_rate = _RATE_TIERS[bisect_left(_SCORE_THRESHOLDS, credit_score)]
+    if min_rate is None:
+        return approved, requested_rate
+    return approved, max(requested_rate, min_rate)
@@ -1,100 +1,201 @@
-from celery import shared_task
+from celery import group, shared_task
 import pandas as pd
 import logging
-import os
 from django.db import transaction
 from django.conf import settings
 from .models import Loan
 from customer.models import Customer
+from alemenosystem.dbutils import reset_pk_sequence
+from alemenosystem.datafiles import LOAN_DATA_PATH, chunk_offsets, iter_chunks, load_df
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def ingest_loan_data():
+# Excel headers -> Loan field names (the customer column is resolved per file)
+LOAN_COLUMNS = {
+    'Loan ID': 'loan_id',
+    'Loan Amount': 'loan_amount',
+    'Tenure': 'tenure',
+    'Interest Rate': 'interest_rate',
+    'Monthly payment': 'monthly_installment',
+    'EMIs paid on Time': 'emis_paid_on_time',
+    'Date of Approval': 'start_date',
+    'End Date': 'end_date',
+}
+LOAN_SOURCE_COLUMNS = ['Customer ID', 'Customer', *LOAN_COLUMNS]
+LOAN_DTYPES = {
+    'Customer ID': 'int64',
+    'Customer': 'int64',
+    'Loan ID': 'int64',
+    'Tenure': 'int64',
+    'EMIs paid on Time': 'int64',
+}
+
+# Loan rows read, filtered and inserted per step of import_loan_data, and
+# handled by each parallel loan ingestion task
+LOAN_CHUNK_SIZE = settings.INGEST_CHUNK_SIZE
+
+# Rows per fetch when streaming existing customer and loan ids
+ID_FETCH_CHUNK_SIZE = 50000
+
+
+def _loans_from_chunk(df, existing_customers, existing_loans, skip_reasons):
+    """
+    Build unsaved Loan objects from one chunk of loan rows, skipping rows for
+    unknown customers or loan ids already seen. Accepted ids are added to
+    `existing_loans` and skip counts to `skip_reasons`, so both carry over
+    to the next chunk.
+    """
+    # Handle different column names
+    customer_col = 'Customer ID' if 'Customer ID' in df.columns else 'Customer'
+    if customer_col not in df.columns:
+        raise ValueError(f"Customer column not found. Available: {list(df.columns)}")
+    
+    df = df.rename(columns={customer_col: 'customer_id', **LOAN_COLUMNS})
+    missing_columns = set(LOAN_COLUMNS.values()) - set(df.columns)
+    if missing_columns:
+        raise ValueError(f"Missing columns in loan data: {sorted(missing_columns)}")
+    
+    for col in ('start_date', 'end_date'):
+        df[col] = pd.to_datetime(df[col], format='%m/%d/%Y')
+    
+    # Filter out unusable rows with whole-column masks. A loan id that is
+    # repeated within the sheet keeps only its first row
+    unknown_customer = ~df['customer_id'].isin(existing_customers)
+    duplicate_loan = ~unknown_customer & (
+        df['loan_id'].isin(existing_loans) | df['loan_id'].where(~unknown_customer).duplicated()
+    )
+    for reason, mask in (('customer_not_found', unknown_customer), ('duplicate_loan', duplicate_loan)):
+        if mask.any():
+            skip_reasons[reason] = skip_reasons.get(reason, 0) + int(mask.sum())
+    
+    valid = df[~(unknown_customer | duplicate_loan)]
+    existing_loans.update(valid['loan_id'].tolist())
+    
+    # The loan FK targets customer_id, so the raw id is assigned directly
+    # without loading the Customer
+    return [
+        Loan(
+            customer_id=row.customer_id,
+            loan_id=row.loan_id,
+            loan_amount=row.loan_amount,
+            tenure=row.tenure,
+            interest_rate=row.interest_rate,
+            monthly_installment=row.monthly_installment,
+            emis_paid_on_time=row.emis_paid_on_time,
+            start_date=row.start_date,
+            end_date=row.end_date,
+        )
+        for row in valid[['customer_id', *LOAN_COLUMNS.values()]].itertuples(index=False)
+    ]
+
+
+def import_loan_data():
     """
     Step 2: Ingest loan data from Excel file
     """
     try:
-        file_path = settings.DATA_DIR / 'loan_data.xlsx'
-
-        
-        if not os.path.exists(file_path):
-            logger.error(f"Loan data file not found: {file_path}")
+        if not LOAN_DATA_PATH.exists():
+            logger.error(f"Loan data file not found: {LOAN_DATA_PATH}")
             return {"status": "error", "message": "Loan data file not found"}
         
-        df = pd.read_excel(file_path)
-        logger.info(f"Loan Excel columns: {list(df.columns)}")
+        # Look up existing customers and loans once up front instead of
+        # querying for each row. The ids are streamed into the sets with a
+        # server-side cursor rather than first cached as a full result list
+        existing_customers = set(
+            Customer.objects.values_list('customer_id', flat=True).iterator(chunk_size=ID_FETCH_CHUNK_SIZE)
+        )
+        existing_loans = set(
+            Loan.objects.values_list('loan_id', flat=True).iterator(chunk_size=ID_FETCH_CHUNK_SIZE)
+        )
         
-        # Handle different column names
-        customer_col = 'Customer ID' if 'Customer ID' in df.columns else 'Customer'
-        
-        if customer_col not in df.columns:
-            return {"status": "error", "message": f"Customer column not found. Available: {list(df.columns)}"}
-        
-        # Parse dates
-        df['Date of Approval'] = pd.to_datetime(df['Date of Approval'], format='%m/%d/%Y')
-        df['End Date'] = pd.to_datetime(df['End Date'], format='%m/%d/%Y')
-        
-        loans_to_create = []
-        skipped = 0
         skip_reasons = {}  # Track skip reasons
+        created = 0
+        total_rows = 0
         
-        for index, row in df.iterrows():
-            try:
-                customer_id = row[customer_col]
-                loan_id = row['Loan ID']
-                
-                # Check if customer exists
-                try:
-                    customer = Customer.objects.get(customer_id=customer_id)
-                except Customer.DoesNotExist:
-                    logger.warning(f"Row {index}: Customer {customer_id} not found for loan {loan_id}")
-                    skipped += 1
-                    skip_reasons['customer_not_found'] = skip_reasons.get('customer_not_found', 0) + 1
-                    continue
-                
-                # Check for duplicate loan IDs
-                if Loan.objects.filter(loan_id=loan_id).exists():
-                    logger.warning(f"Row {index}: Loan {loan_id} already exists, skipping")
-                    skipped += 1
-                    skip_reasons['duplicate_loan'] = skip_reasons.get('duplicate_loan', 0) + 1
-                    continue
-                
-                loan = Loan(
-                    customer=customer,
-                    loan_id=loan_id,
-                    loan_amount=row['Loan Amount'],
-                    tenure=row['Tenure'],
-                    interest_rate=row['Interest Rate'],
-                    monthly_installment=row['Monthly payment'],
-                    emis_paid_on_time=row['EMIs paid on Time'],
-                    start_date=row['Date of Approval'],
-                    end_date=row['End Date'],
-                )
-                loans_to_create.append(loan)
-                
-            except KeyError as e:
-                logger.error(f"Row {index}: Missing column in loan data: {e}")
-                skipped += 1
-                skip_reasons['missing_column'] = skip_reasons.get('missing_column', 0) + 1
-                continue
-            except Exception as e:
-                logger.error(f"Row {index}: Error processing loan row: {e}")
-                skipped += 1
-                skip_reasons['other_error'] = skip_reasons.get('other_error', 0) + 1
-                continue
+        # Rows are read, filtered and inserted one chunk at a time, so memory
+        # stays bounded by the chunk size rather than the sheet size.
+        # Existing and repeated loan ids are filtered out beforehand, so the
+        # insert does not need ON CONFLICT handling
+        with transaction.atomic():
+            chunks = iter_chunks(
+                LOAN_DATA_PATH, LOAN_CHUNK_SIZE, usecols=LOAN_SOURCE_COLUMNS, dtype=LOAN_DTYPES
+            )
+            for chunk in chunks:
+                loans_to_create = _loans_from_chunk(chunk, existing_customers, existing_loans, skip_reasons)
+                Loan.objects.bulk_create(loans_to_create, batch_size=settings.BULK_CREATE_BATCH_SIZE)
+                created += len(loans_to_create)
+                total_rows += len(chunk)
+        
+        reset_pk_sequence(Loan)
+        skipped = total_rows - created
         
         # Log skip reasons
         if skip_reasons:
             logger.info(f"Skip reasons: {skip_reasons}")
         
-        # Bulk create with transaction
+        logger.info(f"Successfully ingested {created} loans, skipped {skipped}")
+        logger.info(f"Total rows in Excel: {total_rows}, Created: {created}, Skipped: {skipped}")
+        
+        return {
+            "status": "success",
+            "count": created,
+            "skipped": skipped,
+            "total_rows": total_rows,
+            "skip_reasons": skip_reasons,
+            "message": f"Successfully ingested {created} loans, skipped {skipped}"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error ingesting loans: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+@shared_task
+def ingest_loan_data():
+    """
+    Celery entry point for import_loan_data()
+    """
+    return import_loan_data()
+
+
+@shared_task
+def ingest_loan_chunk(offset, limit):
+    """
+    Step 2 (parallel): Ingest `limit` loan rows starting at `offset`
+    """
+    try:
+        if not LOAN_DATA_PATH.exists():
+            logger.error(f"Loan data file not found: {LOAN_DATA_PATH}")
+            return {"status": "error", "message": "Loan data file not found"}
+        
+        df = load_df(LOAN_DATA_PATH, usecols=LOAN_SOURCE_COLUMNS, dtype=LOAN_DTYPES)
+        df = df.iloc[offset:offset + limit].copy()
+        
+        # Each task only needs to know about the customers and loans its own
+        # rows refer to
+        customer_col = 'Customer ID' if 'Customer ID' in df.columns else 'Customer'
+        customer_ids = df[customer_col].unique().tolist() if customer_col in df.columns else []
+        existing_customers = set(
+            Customer.objects.filter(customer_id__in=customer_ids).values_list('customer_id', flat=True)
+        )
+        existing_loans = set(
+            Loan.objects.filter(loan_id__in=df['Loan ID'].unique().tolist()).values_list('loan_id', flat=True)
+        )
+        
+        skip_reasons = {}
+        loans_to_create = _loans_from_chunk(df, existing_customers, existing_loans, skip_reasons)
+        
+        # A loan id repeated in the sheet can land in two chunks that run at
+        # the same time, so conflicts are still ignored here
         with transaction.atomic():
-            created_loans = Loan.objects.bulk_create(loans_to_create, batch_size=1000, ignore_conflicts=True)
+            Loan.objects.bulk_create(
+                loans_to_create, batch_size=settings.BULK_CREATE_BATCH_SIZE, ignore_conflicts=True
+            )
         
-        logger.info(f"Successfully ingested {len(loans_to_create)} loans, skipped {skipped}")
-        logger.info(f"Total rows in Excel: {len(df)}, Created: {len(loans_to_create)}, Skipped: {skipped}")
+        reset_pk_sequence(Loan)
         
+        skipped = len(df) - len(loans_to_create)
+        logger.info(f"Successfully ingested {len(loans_to_create)} loans (rows {offset}-{offset + len(df)}), skipped {skipped}")
         return {
             "status": "success",
             "count": len(loans_to_create),
@@ -105,5 +206,16 @@ def ingest_loan_data():
         }
         
     except Exception as e:
-        logger.error(f"Error ingesting loans: {str(e)}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        logger.error(f"Error ingesting loan rows from {offset}: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+def loan_chunk_group(chunk_size=LOAN_CHUNK_SIZE):
+    """
+    Build a Celery group that ingests the loan file in row ranges of
+    `chunk_size`, one task per range
+    """
+    return group(
+        ingest_loan_chunk.si(offset, chunk_size)
+        for offset in chunk_offsets(LOAN_DATA_PATH, 'Loan ID', chunk_size)
+    )
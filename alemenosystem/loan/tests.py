@@ -1,49 +1,86 @@
+from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework import status
 from datetime import date, timedelta
+from unittest.mock import patch
 from django.urls import reverse
 from customer.models import Customer
 from .models import Loan
+from .services import (
+    calculate_credit_score,
+    calculate_monthly_installment,
+    determine_approval,
+)
+from .tasks import _loans_from_chunk
+import pandas as pd
 """UNIT TESTS FOR LOAN APPLICATION VIEWS"""
 
 class LoanViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # One multi-row INSERT per model, shared by every test in the class
+        cls.customer1, cls.customer2, cls.customer3 = Customer.objects.bulk_create([
+            Customer(
+                customer_id=1,
+                first_name="John",
+                last_name="Doe",
+                age=30,
+                phone_number="9999999999",
+                monthly_salary=50000,
+                approved_limit=1000000,
+                current_debt=0
+            ),
+            Customer(
+                customer_id=2,
+                first_name="Jane",
+                last_name="Smith",
+                age=25,
+                phone_number="8888888888",
+                monthly_salary=30000,
+                approved_limit=500000,
+                current_debt=100000
+            ),
+            # Only has a loan that has already ended
+            Customer(
+                customer_id=3,
+                first_name="Bob",
+                last_name="Wilson",
+                age=40,
+                phone_number="7777777777",
+                monthly_salary=60000,
+                approved_limit=800000,
+                current_debt=0
+            ),
+        ])
+
+        cls.loan1, _ = Loan.objects.bulk_create([
+            Loan(
+                customer=cls.customer1,
+                loan_amount=100000,
+                tenure=12,
+                interest_rate=10.0,
+                monthly_installment=8791.59,
+                emis_paid_on_time=5,
+                start_date=date.today() - timedelta(days=150),
+                end_date=date.today() + timedelta(days=215)
+            ),
+            Loan(
+                customer=cls.customer3,
+                loan_amount=50000,
+                tenure=6,
+                interest_rate=12.0,
+                monthly_installment=8606.64,
+                emis_paid_on_time=6,
+                start_date=date.today() - timedelta(days=200),
+                end_date=date.today() - timedelta(days=20)
+            ),
+        ])
+
     def setUp(self):
         self.client = APIClient()
-
-        self.customer1 = Customer.objects.create(
-            customer_id=1,
-            first_name="John",
-            last_name="Doe",
-            age=30,
-            phone_number="9999999999",
-            monthly_salary=50000,
-            approved_limit=1000000,
-            current_debt=0
-        )
-
-        self.customer2 = Customer.objects.create(
-            customer_id=2,
-            first_name="Jane",
-            last_name="Smith",
-            age=25,
-            phone_number="8888888888",
-            monthly_salary=30000,
-            approved_limit=500000,
-            current_debt=100000
-        )
-
-        self.loan1 = Loan.objects.create(
-            loan_id=1,
-            customer=self.customer1,
-            loan_amount=100000,
-            tenure=12,
-            interest_rate=10.0,
-            monthly_installment=8791.59,
-            emis_paid_on_time=5,
-            start_date=date.today() - timedelta(days=150),
-            end_date=date.today() + timedelta(days=215)
-        )
+        # Customers are cached by id and the ids repeat between tests
+        cache.clear()
 
 """ Test cases for Loan Eligibility, Create Loan, View Loan, and View Loans views """
 
@@ -89,6 +126,20 @@ class LoanEligibilityViewTest(LoanViewTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data['approval'])
 
+    def test_rejected_application_skips_emi_check(self):
+        data = {
+            "customer_id": 2,
+            "loan_amount": 50000,
+            "interest_rate": 8.0,
+            "tenure": 12
+        }
+        with patch('loan.views.calculate_monthly_installment') as calculate_emi:
+            response = self.client.post(reverse('check-eligibility'), data, format='json')
+        calculate_emi.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['approval'])
+        self.assertEqual(response.data['monthly_installment'], 0)
+
 
 class CreateLoanViewTest(LoanViewTestCase):
     def test_create_loan_success(self):
@@ -127,6 +178,23 @@ class CreateLoanViewTest(LoanViewTestCase):
         self.assertFalse(response.data['loan_approved'])
         self.assertIn("EMI to salary ratio", response.data['message'])
 
+    def test_create_loan_low_credit_score_rejection(self):
+        data = {
+            "customer_id": 2,
+            "loan_amount": 50000,
+            "interest_rate": 8.0,
+            "tenure": 12
+        }
+        # SAVEPOINT, SELECT ... FOR UPDATE, the loan aggregate and
+        # RELEASE SAVEPOINT; nothing for the EMI check
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('create-loan'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['loan_approved'])
+        self.assertIsNone(response.data['loan_id'])
+        self.assertIn("low credit score", response.data['message'])
+        self.assertFalse(Loan.objects.filter(customer=self.customer2).exists())
+
 
 class ViewLoanViewTest(LoanViewTestCase):
     def test_view_loan_success(self):
@@ -154,68 +222,68 @@ class ViewLoansViewTest(LoanViewTestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_view_loans_no_active_loans(self):
-        customer3 = Customer.objects.create(
-            customer_id=3,
-            first_name="Bob",
-            last_name="Wilson",
-            age=40,
-            phone_number="7777777777",
-            monthly_salary=60000,
-            approved_limit=800000,
-            current_debt=0
-        )
-
-        Loan.objects.create(
-            loan_id=2,
-            customer=customer3,
-            loan_amount=50000,
-            tenure=6,
-            interest_rate=12.0,
-            monthly_installment=8606.64,
-            emis_paid_on_time=6,
-            start_date=date.today() - timedelta(days=200),
-            end_date=date.today() - timedelta(days=20)
-        )
-
-        response = self.client.get(reverse('view-loans', kwargs={'customer_id': customer3.customer_id}))
+        response = self.client.get(reverse('view-loans', kwargs={'customer_id': self.customer3.customer_id}))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
 
 
 class CreditScoreCalculationTest(LoanViewTestCase):
     def test_credit_score_no_history(self):
-        from .views import LoanEligibilityView
-        view = LoanEligibilityView()
-        score = view.calculate_credit_score(self.customer2)
+        score = calculate_credit_score(self.customer2)
         self.assertEqual(score, 0)
 
     def test_credit_score_with_history(self):
-        from .views import LoanEligibilityView
-        view = LoanEligibilityView()
-        score = view.calculate_credit_score(self.customer1)
+        score = calculate_credit_score(self.customer1)
         self.assertGreater(score, 0)
         self.assertLessEqual(score, 100)
 
     def test_monthly_installment_calculation(self):
-        from .views import LoanEligibilityView
-        view = LoanEligibilityView()
-        emi = view.calculate_monthly_installment(100000, 10.0, 12)
+        emi = calculate_monthly_installment(100000, 10.0, 12)
         self.assertAlmostEqual(emi, 8791.59, places=2)
 
     def test_interest_rate_correction(self):
-        from .views import LoanEligibilityView
-        view = LoanEligibilityView()
-        approval, rate = view.determine_approval(60, 8.0)
+        approval, rate = determine_approval(60, 8.0)
         self.assertTrue(approval)
         self.assertEqual(rate, 8.0)
 
-        approval, rate = view.determine_approval(40, 8.0)
+        approval, rate = determine_approval(40, 8.0)
         self.assertTrue(approval)
         self.assertEqual(rate, 12.0)
 
-        approval, rate = view.determine_approval(20, 8.0)
+        approval, rate = determine_approval(20, 8.0)
         self.assertTrue(approval)
         self.assertEqual(rate, 16.0)
 
-        approval, rate = view.determine_approval(5, 8.0)
+        approval, rate = determine_approval(5, 8.0)
         self.assertFalse(approval)
+
+    def test_interest_rate_tier_boundaries(self):
+        # Each threshold belongs to the tier below it
+        self.assertEqual(determine_approval(50, 8.0), (True, 12.0))
+        self.assertEqual(determine_approval(30, 8.0), (True, 16.0))
+        self.assertEqual(determine_approval(10, 8.0), (False, 8.0))
+        self.assertEqual(determine_approval(40, 14.0), (True, 14.0))
+
+
+class LoanIngestionTest(TestCase):
+    def test_chunk_skips_unknown_customers_and_duplicate_loans(self):
+        df = pd.DataFrame({
+            'Customer ID': [1, 1, 2, 9],
+            'Loan ID': [10, 10, 11, 12],
+            'Loan Amount': [100000, 100000, 50000, 20000],
+            'Tenure': [12, 12, 24, 6],
+            'Interest Rate': [10.0, 10.0, 12.0, 8.0],
+            'Monthly payment': [8792, 8792, 2354, 3411],
+            'EMIs paid on Time': [3, 3, 5, 1],
+            'Date of Approval': ['01/15/2024', '01/15/2024', '02/01/2024', '03/01/2024'],
+            'End Date': ['01/15/2025', '01/15/2025', '02/01/2026', '09/01/2024'],
+        })
+        existing_loans = {11}
+        skip_reasons = {}
+
+        loans = _loans_from_chunk(df, {1, 2}, existing_loans, skip_reasons)
+
+        self.assertEqual([loan.loan_id for loan in loans], [10])
+        self.assertEqual(loans[0].customer_id, 1)
+        self.assertEqual(skip_reasons, {'customer_not_found': 1, 'duplicate_loan': 2})
+        self.assertEqual(existing_loans, {10, 11})